@@ -1,15 +1,17 @@
-from fastapi import FastAPI, UploadFile, File
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException
 from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from pathlib import Path
+from typing import Optional
 import tempfile
 import shutil
 import time
 import uuid
 
 import search_engine
+from api.models import TextSearchRequest
 
 # Initialisation au démarrage : CLIP et FAISS se chargent immédiatement
 @asynccontextmanager
@@ -77,8 +79,40 @@ app.mount("/results", StaticFiles(directory=str(results_path)), name="results")
 def root():
     return {"status": "ok", "message": "SnapMyFit API running 🚀"}
 
+def build_result_items(results):
+    """Construit la réponse JSON (URL, référence, marque, prix...) pour une liste de chemins d'images."""
+    base_url_prefix = "/images/"
+    items = []
+    for p in results:
+        p_path = Path(p)
+        # Construire l'URL pour servir l'image
+        url = f"{base_url_prefix}{p_path.name}"
+        
+        # Récupérer les métadonnées (inclut la référence)
+        meta = search_engine.get_metadata_for_image(str(p))
+        img_type = search_engine.image_labels.get(str(p)) or search_engine.image_labels.get(p_path.name)
+        
+        items.append({
+            "imageUrl": url,
+            "path": str(p_path.name),
+            "type": img_type,
+            "ref": meta.get("ref", f"REF-{p_path.stem}"),
+            "name": meta.get("name", p_path.stem),
+            "category": meta.get("category", img_type),
+            "brand": meta.get("brand", "Unknown"),
+            "price": meta.get("price"),
+            "meta": meta  # Garder pour compatibilité
+        })
+    return items
+
 @app.post("/search")
-async def search(file: UploadFile = File(...)):
+async def search(
+    file: UploadFile = File(...),
+    brand: Optional[str] = Form(None),
+    category: Optional[str] = Form(None),
+    price_min: Optional[float] = Form(None),
+    price_max: Optional[float] = Form(None),
+):
     # Sauvegarder le fichier uploadé en temp
     suffix = Path(file.filename).suffix or ".jpg"
     with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
@@ -89,8 +123,14 @@ async def search(file: UploadFile = File(...)):
         start_time = time.time()
         print(f"\n📤 [API] Image uploadée: {file.filename}")
         
+        # Filtres d'attributs optionnels, évalués dans la recherche FAISS
+        filters = {"brand": brand, "category": category, "price_min": price_min, "price_max": price_max}
+        
         # search_image retourne maintenant (results, predicted_type) pour éviter le double appel
-        search_result = search_engine.search_image(str(temp_path), k=5)
+        try:
+            search_result = search_engine.search_image(str(temp_path), k=5, filters=filters)
+        except search_engine.EngineNotReadyError as e:
+            raise HTTPException(status_code=503, detail=str(e))
         if isinstance(search_result, tuple):
             results, predicted_type = search_result
         else:
@@ -123,31 +163,7 @@ async def search(file: UploadFile = File(...)):
             saved_results.append(str(result_dest))
             print(f"💾 [API] Résultat copié: {result_dest}")
         
-        base_url_prefix = "/images/"
-        items = []
-        for p in results:
-            p_path = Path(p)
-            # Construire l'URL pour servir l'image
-            if p_path.parent == images_path or p_path.parent.name == "images":
-                url = f"{base_url_prefix}{p_path.name}"
-            else:
-                url = f"{base_url_prefix}{p_path.name}"
-            
-            # Récupérer les métadonnées (inclut la référence)
-            meta = search_engine.get_metadata_for_image(str(p))
-            img_type = search_engine.image_labels.get(str(p)) or search_engine.image_labels.get(p_path.name)
-            
-            items.append({
-                "imageUrl": url,
-                "path": str(p_path.name),
-                "type": img_type,
-                "ref": meta.get("ref", f"REF-{p_path.stem}"),
-                "name": meta.get("name", p_path.stem),
-                "category": meta.get("category", img_type),
-                "brand": meta.get("brand", "Unknown"),
-                "price": meta.get("price"),
-                "meta": meta  # Garder pour compatibilité
-            })
+        items = build_result_items(results)
         
         print(f"✅ [API] Recherche {search_id} sauvegardée avec {len(saved_results)} résultats")
         return JSONResponse({
@@ -160,3 +176,26 @@ async def search(file: UploadFile = File(...)):
             temp_path.unlink(missing_ok=True)
         except Exception:
             pass
+
+@app.post("/search/text")
+def search_text(request: TextSearchRequest):
+    start_time = time.time()
+    print(f"\n📝 [API] Recherche texte: {request.query}")
+    
+    filters = {
+        "brand": request.brand,
+        "category": request.category,
+        "price_min": request.price_min,
+        "price_max": request.price_max,
+    }
+    try:
+        results = search_engine.search_text(request.query, k=request.k, filters=filters)
+    except search_engine.EngineNotReadyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    elapsed = time.time() - start_time
+    print(f"⚡ [API] Recherche texte terminée en {elapsed:.2f}s ({len(results)} résultats)")
+    return JSONResponse({
+        "query": request.query,
+        "results": build_result_items(results)
+    })
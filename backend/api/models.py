@@ -0,0 +1,13 @@
+from typing import Optional
+
+from pydantic import BaseModel, Field, constr
+
+
+class TextSearchRequest(BaseModel):
+    """Corps de requête de /search/text (filtres d'attributs optionnels, comme /search)."""
+    query: constr(strip_whitespace=True, min_length=1)
+    k: int = Field(5, ge=1, le=50)
+    brand: Optional[str] = None
+    category: Optional[str] = None
+    price_min: Optional[float] = None
+    price_max: Optional[float] = None
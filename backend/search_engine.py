@@ -6,6 +6,8 @@ import clip
 from PIL import Image
 import numpy as np
 from pathlib import Path
+from collections import OrderedDict
+import threading
 import json
 
 # ⚡ Évite les conflits OpenMP sur Windows
@@ -23,12 +25,30 @@ image_labels = None  # labels pour chaque image (robe, jupe...)
 class_to_indices = None  # map: type -> list[int]
 class_to_index = None  # map: type -> FAISS Index (par classe)
 image_metadata = None  # infos ref/brand/prix par image (optionnel)
+attr_bitmaps = None  # map: attribut (brand/category/type) -> valeur -> bitmap d'ids packé (uint8)
+price_sorted = None  # (prix triés, ids correspondants) pour les filtres de plage de prix
+text_index = None  # index FAISS produit scalaire sur les vecteurs normalisés (recherche texte -> image)
 
 # Types de vêtements possibles
 TYPES = ["robe", "jupe", "t-shirt", "pantalon", "short", "veste", "chemise"]
 
+# Attributs filtrables par égalité (les clés des filtres de recherche)
+FILTER_ATTRIBUTES = ["brand", "category"]
+
+# Requêtes texte fréquentes, encodées au démarrage pour éviter le transformer texte à la requête
+POPULAR_TEXT_QUERIES = TYPES + [
+    "red dress", "black dress", "floral summer dress", "white t-shirt", "black t-shirt",
+    "blue jeans", "denim shorts", "leather jacket", "denim jacket", "white shirt",
+    "striped shirt", "pleated skirt", "mini skirt", "black pants", "beige trench coat",
+]
+TEXT_CACHE_SIZE = 1024  # nombre max de requêtes texte encodées gardées en cache (LRU)
+
+class EngineNotReadyError(RuntimeError):
+    """Levée quand une recherche arrive avant la fin de l'initialisation en arrière-plan."""
+
 def initialize():
     global model, preprocess, index, image_paths, image_labels, class_to_indices, image_metadata, class_to_index
+    global attr_bitmaps, price_sorted, text_index
     import time
 
     if model is not None:
@@ -186,6 +206,14 @@ def initialize():
         faiss_elapsed = time.time() - faiss_start
         print(f"✅ [INIT] Index global construit et sauvegardé en {faiss_elapsed:.2f}s")
 
+    # Index produit scalaire sur vecteurs normalisés: similarité cosinus pour la recherche texte
+    if index is not None and index.ntotal > 0:
+        xb = index.reconstruct_n(0, index.ntotal).astype("float32")
+        faiss.normalize_L2(xb)
+        text_index = faiss.IndexFlatIP(xb.shape[1])
+        text_index.add(xb)
+        print(f"✅ [INIT] Index texte (cosinus) construit ({text_index.ntotal} vecteurs)")
+
     # Construire ou charger des index FAISS par classe (si dataset organisé ou labels déjà partiels)
     class_to_indices = {t: [] for t in TYPES}
     for i, p in enumerate(image_paths):
@@ -236,6 +264,21 @@ def initialize():
     else:
         print(f"⚠️ [INIT] Aucun index par classe disponible")
 
+    # Précalculer les bitmaps d'attributs pour filtrer directement dans FAISS
+    print("📦 [INIT] Construction des filtres d'attributs (brand, category, price)...")
+    filters_start = time.time()
+    attr_bitmaps, price_sorted = _build_attribute_filters()
+    filters_elapsed = time.time() - filters_start
+    print(f"✅ [INIT] Filtres construits en {filters_elapsed:.2f}s "
+          f"({len(attr_bitmaps['brand'])} marques, {len(attr_bitmaps['category'])} catégories, "
+          f"{len(price_sorted[0])} prix)")
+
+    # Préencoder les requêtes texte populaires (un seul passage du transformer texte)
+    print(f"📦 [INIT] Préencodage de {len(POPULAR_TEXT_QUERIES)} requêtes texte populaires...")
+    warmup_start = time.time()
+    warmup_text_queries(POPULAR_TEXT_QUERIES)
+    print(f"✅ [INIT] Requêtes texte préencodées en {time.time() - warmup_start:.2f}s")
+
     total_elapsed = time.time() - init_start
     print(f"✅ [INIT] Initialisation complète en {total_elapsed:.2f}s")
     print(f"📊 [INIT] Index prêt avec {len(image_paths)} images au total.")
@@ -276,9 +319,193 @@ def get_type_of_image(image_path: str) -> str:
         idx = similarity.argmax()
         return TYPES[idx]
 
-def search_image(query_img: str, k: int = 5):
+def _normalize_attr(value) -> str:
+    return str(value).strip().lower()
+
+def _ids_to_bitmap(ids, n: int) -> np.ndarray:
+    """Convertit une liste d'ids en bitmap packé (bit i = image i), au format attendu par faiss.IDSelectorBitmap."""
+    mask = np.zeros(n, dtype=bool)
+    mask[np.asarray(ids, dtype="int64")] = True
+    return np.packbits(mask, bitorder="little")
+
+def _build_attribute_filters():
+    """
+    Construit une seule fois les structures de filtrage à partir des métadonnées :
+    - un bitmap d'ids par valeur de brand/category (et par type CLIP via les labels)
+    - les prix triés avec leurs ids, pour résoudre une plage de prix par recherche dichotomique
+    """
+    n = len(image_paths)
+    ids_by_value = {attr: {} for attr in FILTER_ATTRIBUTES}
+    prices, price_ids = [], []
+    for i, p in enumerate(image_paths):
+        meta = get_metadata_for_image(p)
+        for attr in FILTER_ATTRIBUTES:
+            value = meta.get(attr)
+            if value is not None:
+                ids_by_value[attr].setdefault(_normalize_attr(value), []).append(i)
+        try:
+            price = float(meta.get("price"))
+        except (TypeError, ValueError):
+            continue
+        prices.append(price)
+        price_ids.append(i)
+
+    bitmaps = {
+        attr: {v: _ids_to_bitmap(ids, n) for v, ids in values.items()}
+        for attr, values in ids_by_value.items()
+    }
+    bitmaps["type"] = {t: _ids_to_bitmap(ids, n) for t, ids in class_to_indices.items() if ids}
+
+    order = np.argsort(prices, kind="stable")
+    sorted_prices = np.asarray(prices, dtype="float64")[order]
+    sorted_ids = np.asarray(price_ids, dtype="int64")[order]
+    return bitmaps, (sorted_prices, sorted_ids)
+
+def _is_active_filter(value) -> bool:
+    """Un filtre vide ("" ou espaces) est ignoré, comme un champ de formulaire vide sur /search."""
+    return value is not None and not (isinstance(value, str) and not value.strip())
+
+def has_filters(filters) -> bool:
+    return bool(filters) and any(_is_active_filter(v) for v in filters.values())
+
+def build_filter_bitmap(filters: dict, query_type: str = None):
+    """
+    Combine (ET logique) les bitmaps précalculés correspondant aux filtres.
+    filters: {"brand": str, "category": str, "price_min": float, "price_max": float} (valeurs optionnelles)
+    Retourne (bitmap packé, nombre d'images sélectionnées).
+    """
+    n = len(image_paths)
+    empty = np.zeros((n + 7) // 8, dtype=np.uint8)
+    bitmap = np.full((n + 7) // 8, 0xFF, dtype=np.uint8)
+    if n % 8:
+        bitmap[-1] = (1 << (n % 8)) - 1  # bits de padding au-delà de n à 0 (ordre little)
+
+    criteria = [(attr, filters.get(attr)) for attr in FILTER_ATTRIBUTES]
+    criteria.append(("type", query_type))
+    for attr, value in criteria:
+        if not _is_active_filter(value):
+            continue
+        attr_bitmap = attr_bitmaps[attr].get(_normalize_attr(value))
+        if attr_bitmap is None:
+            if attr == "type":
+                # Type prédit sans image labellisée: pas de restriction (comme la recherche non filtrée)
+                continue
+            return empty, 0
+        bitmap &= attr_bitmap
+
+    price_min, price_max = filters.get("price_min"), filters.get("price_max")
+    if price_min is not None or price_max is not None:
+        sorted_prices, sorted_ids = price_sorted
+        lo = 0 if price_min is None else np.searchsorted(sorted_prices, price_min, side="left")
+        hi = len(sorted_prices) if price_max is None else np.searchsorted(sorted_prices, price_max, side="right")
+        if lo >= hi:
+            return empty, 0
+        bitmap &= _ids_to_bitmap(sorted_ids[lo:hi], n)
+
+    count = int(np.count_nonzero(np.unpackbits(bitmap)))
+    return bitmap, count
+
+def search_with_filters(query_emb: np.ndarray, k: int, filters: dict, query_type: str = None,
+                        search_index=None) -> list:
+    """
+    Recherche k plus proches voisins dans l'index global (ou search_index, mêmes ids) en restreignant
+    FAISS aux ids du bitmap, ce qui garantit k résultats tant que k images satisfont les filtres.
+    """
+    if search_index is None:
+        search_index = index
+    bitmap, count = build_filter_bitmap(filters, query_type)
+    print(f"📊 [SEARCH] Filtres {filters} (type: {query_type}) → {count} images candidates")
+    if count == 0:
+        return []
+    selector = faiss.IDSelectorBitmap(bitmap.size, faiss.swig_ptr(bitmap))
+    params = faiss.SearchParameters(sel=selector)
+    D, I = search_index.search(query_emb, min(k, count), params=params)
+    return [image_paths[i] for i in I[0] if i >= 0]
+
+# Cache LRU des requêtes texte encodées: requête normalisée -> embedding normalisé (1, dim)
+_text_query_cache = OrderedDict()
+_text_query_lock = threading.Lock()
+
+def _normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+def _encode_texts(queries: list) -> np.ndarray:
+    """Encode un lot de requêtes texte avec CLIP (un seul passage) et normalise les vecteurs."""
+    text_tokens = clip.tokenize(queries, truncate=True).to(device)
+    with torch.no_grad():
+        text_features = model.encode_text(text_tokens).float()
+        text_features /= text_features.norm(dim=-1, keepdim=True)
+    return text_features.cpu().numpy().astype("float32")
+
+def _cache_text_embedding(key: str, emb: np.ndarray):
+    _text_query_cache[key] = emb
+    _text_query_cache.move_to_end(key)
+    while len(_text_query_cache) > TEXT_CACHE_SIZE:
+        _text_query_cache.popitem(last=False)
+
+def warmup_text_queries(queries: list):
+    """Encode en un seul lot les requêtes pas encore en cache (appelé au démarrage)."""
+    keys = list(dict.fromkeys(_normalize_query(q) for q in queries if q and q.strip()))
+    with _text_query_lock:
+        missing = [key for key in keys if key not in _text_query_cache]
+    if not missing:
+        return
+    embs = _encode_texts(missing)
+    with _text_query_lock:
+        for key, emb in zip(missing, embs):
+            _cache_text_embedding(key, emb[None, :])
+
+def get_text_embedding(query: str):
+    """
+    Retourne (embedding CLIP normalisé, trouvé en cache) pour une requête texte.
+    Servi depuis le cache LRU si possible, sinon encodé puis mis en cache.
+    """
+    key = _normalize_query(query)
+    with _text_query_lock:
+        emb = _text_query_cache.get(key)
+        if emb is not None:
+            _text_query_cache.move_to_end(key)
+            return emb, True
+    emb = _encode_texts([key])
+    with _text_query_lock:
+        _cache_text_embedding(key, emb)
+    return emb, False
+
+def search_text(query: str, k: int = 5, filters: dict = None) -> list:
+    """
+    Recherche d'images du catalogue à partir d'une description texte ("red floral summer dress").
+    Similarité cosinus texte/image via text_index ; filters comme pour search_image.
+    """
+    import time
+
+    if index is None:
+        print("⚠️ [SEARCH] Index non initialisé, initialisation en cours...")
+        initialize()  # fallback si pas initialisé au démarrage
+    if text_index is None or (has_filters(filters) and attr_bitmaps is None):
+        raise EngineNotReadyError("Index texte en cours de construction, réessayez dans quelques secondes")
+
+    search_start = time.time()
+    print(f"\n🔍 [SEARCH] Recherche texte: \"{query}\"")
+    query_emb, cached = get_text_embedding(query)
+    emb_elapsed = time.time() - search_start
+    print(f"📊 [SEARCH] Embedding texte {'(cache)' if cached else 'encodé'} ({emb_elapsed:.3f}s)")
+
+    faiss_start = time.time()
+    if has_filters(filters):
+        selected = search_with_filters(query_emb, k, filters, search_index=text_index)
+    else:
+        D, I = text_index.search(query_emb, min(k, text_index.ntotal))
+        selected = [image_paths[i] for i in I[0] if i >= 0]
+    faiss_elapsed = time.time() - faiss_start
+    total_elapsed = time.time() - search_start
+    print(f"✅ [SEARCH] {len(selected)} résultats trouvés en {total_elapsed:.2f}s (FAISS: {faiss_elapsed:.3f}s)")
+    return selected
+
+def search_image(query_img: str, k: int = 5, filters: dict = None):
     """
     Recherche d'images similaires. Retourne (results, predicted_type) pour éviter les appels redondants.
+    filters (optionnel): brand / category / price_min / price_max, évalués directement dans FAISS.
+    Si une catégorie est demandée, elle remplace la restriction au type prédit.
     """
     global index, image_paths, image_labels, class_to_indices, class_to_index
     import time
@@ -287,6 +514,8 @@ def search_image(query_img: str, k: int = 5):
     if index is None:
         print("⚠️ [SEARCH] Index non initialisé, initialisation en cours...")
         initialize()  # fallback si pas initialisé au démarrage
+    if has_filters(filters) and attr_bitmaps is None:
+        raise EngineNotReadyError("Filtres d'attributs en cours de construction, réessayez dans quelques secondes")
 
     search_start = time.time()
     
@@ -303,6 +532,16 @@ def search_image(query_img: str, k: int = 5):
     emb_elapsed = time.time() - emb_start
     print(f"📊 [SEARCH] Embedding extrait ({emb_elapsed:.2f}s)")
 
+    # Recherche filtrée par attributs: bitmap précalculé passé à FAISS
+    if has_filters(filters):
+        type_filter = None if _is_active_filter(filters.get("category")) else query_type
+        faiss_start = time.time()
+        selected = search_with_filters(query_emb, k, filters, type_filter)
+        faiss_elapsed = time.time() - faiss_start
+        total_elapsed = time.time() - search_start
+        print(f"✅ [SEARCH] {len(selected)} résultats filtrés trouvés en {total_elapsed:.2f}s (FAISS: {faiss_elapsed:.3f}s)")
+        return selected, query_type
+
     # 3️⃣ Filtrer candidats par type AVANT la recherche si possible
     candidate_indices = class_to_indices.get(query_type, [])
     print(f"📊 [SEARCH] Nombre d'images dans la catégorie '{query_type}': {len(candidate_indices)}")